@@ -6,11 +6,43 @@ Creates a distributable plugin package
 
 import os
 import sys
-import shutil
+import hashlib
 import zipfile
 import subprocess
 from pathlib import Path
 
+# Inputs that affect the PyInstaller output
+BUILD_INPUTS = [
+    "plugin.py", "canvas_overlay.py", "config.json", "manifest.json",
+    "assets/aria_icon.ico",
+]
+BUILD_HASH_FILE = Path("dist/.aria_build_hash")
+
+# Persistent pip wheel cache, reused across builds
+PIP_CACHE_DIR = Path.home() / ".aria_pip_cache"
+
+# Already compressed payloads, stored as-is in the package zip
+STORED_SUFFIXES = (".png", ".exe")
+
+def compute_build_hash(cmd):
+    """Hash the build inputs and PyInstaller arguments"""
+    digest = hashlib.sha256()
+    sources = list(BUILD_INPUTS)
+    for root, dirs, files in os.walk("sprites"):
+        dirs.sort()
+        sources.extend(os.path.join(root, file) for file in sorted(files))
+    for src in sources:
+        # Name and length first, so content moved between files changes the hash
+        size = os.path.getsize(src) if os.path.exists(src) else -1
+        digest.update(f"{src}\0{size}\0".encode('utf-8'))
+        if size >= 0:
+            with open(src, 'rb') as f:
+                for block in iter(lambda: f.read(65536), b""):
+                    digest.update(block)
+    for arg in sorted(cmd):
+        digest.update(arg.encode('utf-8') + b"\0")
+    return digest.hexdigest()
+
 def build_executable():
     """Build the plugin executable using PyInstaller"""
     print("Building Aria Avatar Companion executable...")
@@ -19,6 +51,7 @@ def build_executable():
     cmd = [
         sys.executable, "-m", "PyInstaller",
         "--onefile",
+        "--noconfirm",
         "--windowed",
         "--name", "aria_companion",
         "--icon", "assets/aria_icon.ico" if os.path.exists("assets/aria_icon.ico") else "NONE",
@@ -29,11 +62,31 @@ def build_executable():
         "--hidden-import", "google.genai",
         "--hidden-import", "PyQt5",
         "--hidden-import", "psutil",
+        # Modules the plugin never uses
+        "--exclude-module", "tkinter",
+        "--exclude-module", "numpy",
+        "--exclude-module", "matplotlib",
+        "--exclude-module", "PyQt5.QtSql",
+        "--exclude-module", "PyQt5.QtNetwork",
+        "--exclude-module", "PyQt5.QtXml",
+        "--exclude-module", "PyQt5.QtMultimedia",
+        "--exclude-module", "PyQt5.QtWebEngineCore",
+        "--noupx",
+        "--optimize", "2",
         "plugin.py"
     ]
     
+    # Skip PyInstaller when nothing changed since the last build
+    build_hash = compute_build_hash(cmd)
+    exe_path = Path("dist/aria_companion.exe")
+    if exe_path.exists() and BUILD_HASH_FILE.exists():
+        if BUILD_HASH_FILE.read_text().strip() == build_hash:
+            print("OK Executable up to date, skipping build")
+            return True
+    
     try:
         subprocess.run(cmd, check=True)
+        BUILD_HASH_FILE.write_text(build_hash)
         print("OK Executable built successfully")
         return True
     except subprocess.CalledProcessError as e:
@@ -44,58 +97,47 @@ def create_plugin_package():
     """Create the final minimal plugin package"""
     print("\nCreating minimal plugin package...")
     
-    # Create dist directory if not exists
-    dist_dir = Path("dist/aria")
-    dist_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Essential files to copy
-    files_to_copy = [
+    # Essential files: (source, path inside the package)
+    files_to_package = [
         ("manifest.json", "manifest.json"),
     ]
     
-    # Copy files
-    for src, dst in files_to_copy:
-        if os.path.exists(src):
-            shutil.copy2(src, dist_dir / dst)
-            print(f"OK Copied {src}")
-        else:
+    for src, dst in files_to_package:
+        if not os.path.exists(src):
             print(f"ERROR: {src} not found!")
             return None
     
-    # Copy essential directories
-    dirs_to_copy = ["sprites"]
-    for dir_name in dirs_to_copy:
-        if os.path.exists(dir_name):
-            shutil.copytree(dir_name, dist_dir / dir_name, dirs_exist_ok=True)
-            print(f"OK Copied {dir_name} directory")
-        else:
-            print(f"WARNING: {dir_name} directory not found")
-    
-    # Copy executable - CRITICAL FILE
+    # Executable - CRITICAL FILE
     exe_path = Path("dist/aria_companion.exe")
-    if exe_path.exists():
-        shutil.copy2(exe_path, dist_dir / "aria_companion.exe")
-        print("OK Copied executable")
-    else:
+    if not exe_path.exists():
         print("ERROR: aria_companion.exe not found!")
         return None
-        
-    # Create API key example
-    gemini_key_example = dist_dir / "gemini.key.example"
-    with open(gemini_key_example, 'w') as f:
-        f.write("YOUR_GEMINI_API_KEY_HERE")
-    print("OK Created gemini.key.example")
+    files_to_package.append((exe_path, "aria_companion.exe"))
     
-    # Create final zip with aria folder structure
-    zip_name = "aria_avatar_companion_v1.1.0.zip"
-    with zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, dirs, files in os.walk(dist_dir):
+    # Essential directories
+    dirs_to_package = ["sprites"]
+    for dir_name in dirs_to_package:
+        if not os.path.exists(dir_name):
+            print(f"WARNING: {dir_name} directory not found")
+            continue
+        for root, dirs, files in os.walk(dir_name):
             for file in files:
                 file_path = Path(root) / file
-                # Create archive path: aria/filename
-                rel_path = file_path.relative_to(dist_dir)
-                arcname = Path("aria") / rel_path
-                zipf.write(file_path, arcname)
+                files_to_package.append((file_path, file_path.as_posix()))
+    
+    # Write everything straight into the zip with aria folder structure
+    zip_name = "aria_avatar_companion_v1.1.0.zip"
+    with zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+        for src, dst in files_to_package:
+            if str(src).lower().endswith(STORED_SUFFIXES):
+                zipf.write(src, f"aria/{dst}", compress_type=zipfile.ZIP_STORED)
+            else:
+                zipf.write(src, f"aria/{dst}")
+            print(f"OK Added {src}")
+        
+        # API key example
+        zipf.writestr("aria/gemini.key.example", "YOUR_GEMINI_API_KEY_HERE")
+        print("OK Added gemini.key.example")
     
     print(f"\nOK Plugin package created: {zip_name}")
     print(f"  Size: {os.path.getsize(zip_name) / 1024 / 1024:.2f} MB")
@@ -115,7 +157,12 @@ def main():
         import PyInstaller
     except ImportError:
         print("Installing PyInstaller...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "pyinstaller"])
+        subprocess.check_call([
+            sys.executable, "-m", "pip", "install",
+            "--cache-dir", str(PIP_CACHE_DIR),
+            "--prefer-binary",
+            "pyinstaller"
+        ])
     
     # Build executable (always build for deploy)
     build_exe = True
@@ -6,9 +6,47 @@ Canvas-based Aria Overlay - Single window with sprite shifting
 import sys
 import os
 import time
+import collections
+import mmap
+import re
 from PyQt5.QtWidgets import QApplication, QLabel, QDesktopWidget, QWidget
-from PyQt5.QtCore import Qt, QPoint, QTimer, QRect
-from PyQt5.QtGui import QPixmap, QMouseEvent, QPainter, QFont, QPen, QBrush, QColor, QPainterPath
+from PyQt5.QtCore import Qt, QPoint, QTimer, QRect, QFileSystemWatcher
+from PyQt5.QtGui import QPixmap, QMouseEvent, QPainter, QFont, QPen, QBrush, QColor, QPainterPath, QFontMetrics, QStaticText, QTransform
+
+# Emotion keywords
+ANGRY_WORDS = frozenset({'angry', 'mad', 'pissed', 'furious', 'rage', 'hate'})
+SAD_WORDS = frozenset({'sad', 'sorry', 'upset', 'disappointed', 'depressed', 'cry'})
+GREETING_WORDS = frozenset({'hello', 'hi', 'hey', 'greetings', 'good morning'})
+HAPPY_WORDS = frozenset({'happy', 'great', 'awesome', 'love', 'amazing', 'win'})
+SPEAKING_WORDS = frozenset({'response chunk'})
+
+# Emotion frames in priority order: (frame, keywords)
+EMOTION_KEYWORDS = (
+    (2, ANGRY_WORDS),  # Angry
+    (4, SAD_WORDS),  # Sad
+    (3, GREETING_WORDS),  # Greeting
+    (1, HAPPY_WORDS),  # Happy
+    (9, SPEAKING_WORDS),  # Speaking
+)
+
+# Single pattern over all emotion keywords
+EMOTION_FRAMES = {word: frame for frame, words in EMOTION_KEYWORDS for word in words}
+EMOTION_PATTERN = re.compile(
+    r'\b(' + '|'.join(re.escape(word) for word in sorted(EMOTION_FRAMES)) + r')\b'
+)
+
+# Speech bubble colors, shared by every paint
+BUBBLE_SHADOW_COLOR = QColor(0, 0, 0, 50)
+BUBBLE_FILL_COLOR = QColor(30, 30, 30, 240)
+BUBBLE_BORDER_PEN = QPen(QColor(100, 100, 100, 200), 1)
+BUBBLE_TEXT_PEN = QPen(QColor(255, 255, 255))
+
+def stat_or_none(path):
+    """Single stat call giving existence, size and mtime"""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
 
 class CanvasAriaOverlay(QLabel):
     def __init__(self):
@@ -19,10 +57,13 @@ class CanvasAriaOverlay(QLabel):
         self.sprite_sheet = None
         self.frame_width = 0
         self.frame_height = 0
+        self._scaled_frames = {}
+        self._sprite_pixmap = None
         
         # Speech bubble properties
         self.speech_text = ""
         self.speech_visible = False
+        self._bubble_layout = None
         self.speech_timer = QTimer()
         self.speech_timer.timeout.connect(self.hideSpeechBubble)
         self.last_log_size = 0
@@ -36,8 +77,8 @@ class CanvasAriaOverlay(QLabel):
         
         self.setupWindow()
         self.loadSpriteSheet()
-        self.setupAnimationTimer()
         self.setupLogWatcher()
+        self.setupFileWatcher()
         
     def setupWindow(self):
         self.setWindowTitle("Aria Avatar")
@@ -76,6 +117,15 @@ class CanvasAriaOverlay(QLabel):
                 self.frame_width = self.sprite_sheet.width() // 5
                 self.frame_height = self.sprite_sheet.height() // 2
                 
+                # Crop and scale every frame once
+                self._scaled_frames = {
+                    i: self.sprite_sheet.copy(
+                        (i % 5) * self.frame_width, (i // 5) * self.frame_height,
+                        self.frame_width, self.frame_height
+                    ).scaled(350, 350, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+                    for i in range(10)
+                }
+                
                 # Start with frame 0 (idle)
                 self.displayFrame(0)
                 print(f"Loaded sprite sheet: {sprite_path}")
@@ -88,59 +138,65 @@ class CanvasAriaOverlay(QLabel):
         self.setStyleSheet("color: white; font-size: 24px; background-color: rgba(255, 182, 193, 150); border-radius: 20px;")
         
     def displayFrame(self, frame_number):
-        """Display specific frame by cropping from sprite sheet"""
+        """Display specific frame from the cached sprite frames"""
         if not self.sprite_sheet or self.sprite_sheet.isNull():
             return
             
-        # Calculate position in 5x2 grid
-        col = frame_number % 5
-        row = frame_number // 5
-        
-        # Crop the frame
-        x = col * self.frame_width
-        y = row * self.frame_height
-        
-        frame = self.sprite_sheet.copy(x, y, self.frame_width, self.frame_height)
-        
-        # Scale to overlay size
-        scaled_frame = frame.scaled(350, 350, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        
-        # Create a new pixmap with space for speech bubble
-        full_pixmap = QPixmap(450, 550)
-        full_pixmap.fill(Qt.transparent)
+        old_rect = self.spriteRect()
+        self._sprite_pixmap = self._scaled_frames[frame_number]
+        self.current_frame = frame_number
         
-        painter = QPainter(full_pixmap)
+        # Only the sprite area needs repainting
+        self.update(old_rect.united(self.spriteRect()))
+        
+    def spriteRect(self):
+        """Area covered by the sprite, anchored at the bottom"""
+        if self._sprite_pixmap is None:
+            return QRect()
+        sprite_x = (450 - self._sprite_pixmap.width()) // 2
+        return QRect(sprite_x, 150, self._sprite_pixmap.width(), self._sprite_pixmap.height())
+        
+    def updateSpeechBubble(self):
+        """Repaint only the speech bubble area (box, shadow and max height)"""
+        self.update(QRect(0, 0, 450, 272))
+        
+    def paintEvent(self, event):
+        """Draw the speech bubble and the current sprite frame"""
+        if self._sprite_pixmap is None:
+            # Fallback text label
+            super().paintEvent(event)
+            return
+            
+        painter = QPainter(self)
         
         # Draw speech bubble if visible
         if self.speech_visible and self.speech_text:
             self.drawSpeechBubble(painter)
         
         # Draw sprite at bottom
-        sprite_y = 150
-        sprite_x = (450 - scaled_frame.width()) // 2
-        painter.drawPixmap(sprite_x, sprite_y, scaled_frame)
-        
+        painter.drawPixmap(self.spriteRect().topLeft(), self._sprite_pixmap)
         painter.end()
-        self.setPixmap(full_pixmap)
-        
-        self.current_frame = frame_number
-        
-    def setupAnimationTimer(self):
-        """Setup timer for checking emotions"""
-        self.animation_timer = QTimer()
-        self.animation_timer.timeout.connect(self.checkEmotionState)
-        self.animation_timer.start(1000)
         
     def setupLogWatcher(self):
         """Setup G-Assist shutdown detection and speech monitoring"""
+        # Inactivity check, G-Assist shutdown does not need a fast poll
         self.log_timer = QTimer()
         self.log_timer.timeout.connect(self.checkGAssistRunning)
-        self.log_timer.start(5000)
+        self.log_timer.start(30000)
+        
+        # Cheap size poll, the file watcher can miss writes to a log the plugin keeps open
+        self.log_poll_timer = QTimer()
+        self.log_poll_timer.timeout.connect(self.pollLogSize)
+        self.log_poll_timer.start(1000)
         
         # Initialize log size for speech detection
         self.log_file = os.path.join(os.environ.get("USERPROFILE", "."), 'aria_plugin.log')
-        if os.path.exists(self.log_file):
-            self.last_log_size = os.path.getsize(self.log_file)
+        log_stat = stat_or_none(self.log_file)
+        if log_stat is not None:
+            self.last_log_size = log_stat.st_size
+        
+        # Last log lines used for emotion detection, fed by checkForNewSpeech
+        self._log_tail_buf = collections.deque(maxlen=10)
         
         # Initialize chat context monitoring
         self.chat_context_file = os.path.join(os.environ.get("USERPROFILE", "."), 'aria_chat_context.txt')
@@ -149,63 +205,69 @@ class CanvasAriaOverlay(QLabel):
         print(f"Monitoring log file: {self.log_file}")
         print(f"Monitoring chat context: {self.chat_context_file}")
         
+    def setupFileWatcher(self):
+        """React to log and chat context file changes as soon as they are reported"""
+        self.file_watcher = QFileSystemWatcher(self)
+        self.file_watcher.fileChanged.connect(self.onFileChanged)
+        self.watchFiles()
+        
+    def watchFiles(self):
+        """Watch the log and chat context files, re-adding them if created late or replaced"""
+        watched = self.file_watcher.files()
+        if self.log_file not in watched and os.path.exists(self.log_file):
+            self.file_watcher.addPath(self.log_file)
+        if self.chat_context_file not in watched and os.path.exists(self.chat_context_file):
+            self.file_watcher.addPath(self.chat_context_file)
+            # Written before we could watch it
+            self.checkForNewChatContext()
+            
+    def onFileChanged(self, path):
+        """Dispatch a change notification to the matching check"""
+        self.watchFiles()
+        if path == self.chat_context_file:
+            self.checkForNewChatContext()
+        else:
+            self.checkEmotionState()
+        
     def checkEmotionState(self):
         """Check log file for emotion keywords and monitor speech"""
         try:
-            if not os.path.exists(self.log_file):
+            log_stat = stat_or_none(self.log_file)
+            if log_stat is None:
                 return
             
-            # Check for new chat context
-            self.checkForNewChatContext()
-            
-            # Enable speech monitoring
-            self.checkForNewSpeech(self.log_file)
-                
-            # Read recent log entries
-            with open(self.log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-                recent_lines = ''.join(lines[-10:]).lower()
-                
-            # Emotion detection
-            new_frame = None
-            
-            if any(word in recent_lines for word in [
-                'angry', 'mad', 'pissed', 'furious', 'rage', 'hate'
-            ]):
-                new_frame = 2  # Angry
-                
-            elif any(word in recent_lines for word in [
-                'sad', 'sorry', 'upset', 'disappointed', 'depressed', 'cry'
-            ]):
-                new_frame = 4  # Sad
-                
-            elif any(word in recent_lines for word in [
-                'hello', 'hi', 'hey', 'greetings', 'good morning'
-            ]):
-                new_frame = 3  # Greeting
-                
-            elif any(word in recent_lines for word in [
-                'happy', 'great', 'awesome', 'love', 'amazing', 'win'
-            ]):
-                new_frame = 1  # Happy
+            # Enable speech monitoring, single pass over the new log content
+            new_lines = self.checkForNewSpeech(self.log_file, log_stat.st_size)
+            if not new_lines:
+                return
                 
-            elif 'response chunk' in recent_lines:
-                new_frame = 9  # Speaking
+            # Recent log entries
+            self._log_tail_buf.extend(line for line in new_lines if line)
+            recent_lines = '\n'.join(self._log_tail_buf).lower()
                 
-            else:
-                new_frame = 0  # Idle
+            # Emotion detection, highest priority match wins
+            found = {EMOTION_FRAMES[m.group(1)] for m in EMOTION_PATTERN.finditer(recent_lines)}
+            new_frame = next((frame for frame, _ in EMOTION_KEYWORDS if frame in found), 0)  # Idle
                 
-            if new_frame is not None and new_frame != self.current_frame:
+            if new_frame != self.current_frame:
                 self.displayFrame(new_frame)
                 
         except Exception as e:
             print(f"Error checking emotion state: {e}")
             
+    def pollLogSize(self):
+        """Check the log only when its size changed since the last read"""
+        log_stat = stat_or_none(self.log_file)
+        if log_stat is not None and log_stat.st_size != self.last_log_size:
+            self.checkEmotionState()
+            
     def checkGAssistRunning(self):
         """Check if G-Assist is still active"""
         try:
-            if os.path.exists(self.log_file):
-                file_age = time.time() - os.path.getmtime(self.log_file)
+            log_stat = stat_or_none(self.log_file)
+            if log_stat is not None:
+                self.watchFiles()
+                file_age = time.time() - log_stat.st_mtime
                 
                 if file_age > 120:
                     print("G-Assist inactive, closing overlay...")
@@ -222,11 +284,11 @@ class CanvasAriaOverlay(QLabel):
     def checkForNewChatContext(self):
         """Check for new chat context and update display"""
         try:
-            if not os.path.exists(self.chat_context_file):
+            try:
+                with open(self.chat_context_file, 'r', encoding='utf-8') as f:
+                    new_context = f.read().strip()
+            except FileNotFoundError:
                 return
-                
-            with open(self.chat_context_file, 'r', encoding='utf-8') as f:
-                new_context = f.read().strip()
             
             if new_context != self.last_chat_context:
                 self.last_chat_context = new_context
@@ -240,7 +302,7 @@ class CanvasAriaOverlay(QLabel):
         """Show chat context as speech bubble"""
         self.speech_text = context_text
         self.speech_visible = True
-        self.displayFrame(self.current_frame)
+        self.updateSpeechBubble()
         self.speech_timer.stop()
         self.speech_timer.start(8000)
     
@@ -257,19 +319,23 @@ class CanvasAriaOverlay(QLabel):
         if event.button() == Qt.LeftButton:
             self.dragging = False
     
-    def checkForNewSpeech(self, log_file):
-        """Monitor log file for new Aria responses"""
+    def checkForNewSpeech(self, log_file, current_size):
+        """Monitor log file for new Aria responses and return the new lines"""
+        lines = []
         try:
-            current_size = os.path.getsize(log_file)
+            # Log was truncated or recreated, start over
+            if current_size < self.last_log_size:
+                self.last_log_size = 0
             
             if current_size > self.last_log_size:
-                with open(log_file, 'r', encoding='utf-8', errors='ignore') as f:
-                    f.seek(self.last_log_size)
-                    new_content = f.read()
+                # Map only for this read so the plugin can still truncate the log
+                with open(log_file, 'rb') as f:
+                    with mmap.mmap(f.fileno(), current_size, access=mmap.ACCESS_READ) as log_map:
+                        new_content = log_map[self.last_log_size:current_size].decode('utf-8', 'ignore')
                     
                 self.last_log_size = current_size
                 
-                lines = new_content.split('\n')
+                lines = new_content.splitlines()
                 
                 for i, line in enumerate(lines):
                     if 'response chunk:' in line.lower():
@@ -295,24 +361,22 @@ class CanvasAriaOverlay(QLabel):
                             
         except Exception as e:
             print(f"Error monitoring speech: {e}")
+        
+        return lines
     
     def completeResponse(self):
         """Complete the accumulated response and show in speech bubble"""
         if self.response_chunks:
-            # Smart chunk joining
-            full_response = ""
-            for i, chunk in enumerate(self.response_chunks):
-                if i == 0:
-                    full_response = chunk
-                else:
-                    if (chunk.startswith(('!', '?', '.', ',', '~', '^', '_')) or 
-                        full_response.endswith((' ')) or
-                        chunk.startswith(' ')):
-                        full_response += chunk
-                    else:
-                        full_response += ' ' + chunk
+            # Smart chunk joining, no space before punctuation
+            parts = []
+            needs_space = False
+            for chunk in self.response_chunks:
+                if needs_space and not chunk.startswith(('!', '?', '.', ',', '~', '^', '_', ' ')):
+                    parts.append(' ')
+                parts.append(chunk)
+                needs_space = not chunk.endswith(' ')
             
-            full_response = full_response.strip()
+            full_response = ''.join(parts).strip()
             self.showSpeechBubble(full_response)
             
             self.accumulating_response = False
@@ -328,7 +392,7 @@ class CanvasAriaOverlay(QLabel):
             
         self.speech_text = text
         self.speech_visible = True
-        self.displayFrame(self.current_frame)
+        self.updateSpeechBubble()
         
         self.speech_timer.stop()
         self.speech_timer.start(15000)
@@ -337,25 +401,27 @@ class CanvasAriaOverlay(QLabel):
         """Hide the speech bubble"""
         self.speech_visible = False
         self.speech_timer.stop()
-        self.displayFrame(self.current_frame)
+        self.updateSpeechBubble()
     
-    def drawSpeechBubble(self, painter):
-        """Draw G-Assist style chat box"""
-        if not self.speech_text:
-            return
-            
-        painter.setRenderHint(QPainter.Antialiasing)
-        painter.setRenderHint(QPainter.TextAntialiasing, True)
-        
+    def bubbleFont(self):
+        """Font used for the speech bubble text"""
         # Use Arial for better Turkish character support
         font = QFont("Arial", 12, QFont.Normal)
         font.setStyleHint(QFont.SansSerif)
         font.setFamily("Arial, Tahoma, Segoe UI, sans-serif")
-        painter.setFont(font)
+        return font
+    
+    def layoutSpeechBubble(self, text):
+        """Wrap text once and cache (font, box_width, box_height, line_height, lines)"""
+        if self._bubble_layout is not None and self._bubble_layout[0] == text:
+            return self._bubble_layout[1]
+            
+        font = self.bubbleFont()
+        fm = QFontMetrics(font)
         
         # Dynamic dimensions
         padding = 20
-        text_length = len(self.speech_text)
+        text_length = len(text)
         
         if text_length < 30:
             box_width = 300
@@ -366,40 +432,8 @@ class CanvasAriaOverlay(QLabel):
         else:
             box_width = 520
         
-        # Calculate text height
-        fm = painter.fontMetrics()
-        from PyQt5.QtGui import QTextDocument
-        doc = QTextDocument()
-        doc.setDefaultFont(font)
-        doc.setTextWidth(box_width - padding * 2)
-        # Ensure proper UTF-8 handling
-        doc.setPlainText(str(self.speech_text))
-        text_height = int(doc.size().height())
-        
-        min_height = 60
-        max_height = 250
-        box_height = max(min_height, min(max_height, text_height + padding * 2))
-        
-        # Position
-        box_x = (450 - box_width) // 2
-        if box_x < 0:
-            box_x = -15
-        box_y = 20
-        
-        # Draw box
-        shadow_rect = QRect(box_x + 2, box_y + 2, box_width, box_height)
-        painter.fillRect(shadow_rect, QColor(0, 0, 0, 50))
-        
-        main_rect = QRect(box_x, box_y, box_width, box_height)
-        painter.fillRect(main_rect, QColor(30, 30, 30, 240))
-        
-        painter.setPen(QPen(QColor(100, 100, 100, 200), 1))
-        painter.drawRect(main_rect)
-        
-        # Draw text with manual line breaking
-        painter.setPen(QPen(QColor(255, 255, 255)))
-        
-        words = self.speech_text.split()
+        # Manual line breaking
+        words = text.split()
         lines = []
         current_line = ""
         max_width = box_width - padding * 2
@@ -418,32 +452,115 @@ class CanvasAriaOverlay(QLabel):
         if current_line:
             lines.append(current_line)
         
-        # Draw each line
+        # Precomputed glyph layout for each line
+        static_lines = []
+        for line in lines:
+            static_line = QStaticText(line)
+            static_line.setTextFormat(Qt.PlainText)
+            static_line.prepare(QTransform(), font)
+            static_lines.append(static_line)
+        
         line_height = fm.height() + 2
-        start_y = box_y + padding + fm.ascent()
+        text_height = len(lines) * line_height
+        
+        min_height = 60
+        max_height = 250
+        box_height = max(min_height, min(max_height, text_height + padding * 2))
         
-        for i, line in enumerate(lines):
-            painter.drawText(box_x + padding, start_y + (i * line_height), line)
+        layout = (font, box_width, box_height, line_height, static_lines)
+        self._bubble_layout = (text, layout)
+        return layout
+    
+    def drawSpeechBubble(self, painter):
+        """Draw G-Assist style chat box"""
+        if not self.speech_text:
+            return
+            
+        painter.setRenderHint(QPainter.Antialiasing)
+        painter.setRenderHint(QPainter.TextAntialiasing, True)
+        
+        font, box_width, box_height, line_height, static_lines = self.layoutSpeechBubble(self.speech_text)
+        painter.setFont(font)
+        padding = 20
+        
+        # Position
+        box_x = (450 - box_width) // 2
+        if box_x < 0:
+            box_x = -15
+        box_y = 20
+        
+        # Draw box
+        shadow_rect = QRect(box_x + 2, box_y + 2, box_width, box_height)
+        painter.fillRect(shadow_rect, BUBBLE_SHADOW_COLOR)
+        
+        main_rect = QRect(box_x, box_y, box_width, box_height)
+        painter.fillRect(main_rect, BUBBLE_FILL_COLOR)
+        
+        painter.setPen(BUBBLE_BORDER_PEN)
+        painter.drawRect(main_rect)
+        
+        # Draw each line
+        painter.setPen(BUBBLE_TEXT_PEN)
+        for i, static_line in enumerate(static_lines):
+            painter.drawStaticText(box_x + padding, box_y + padding + (i * line_height), static_line)
+
+def read_lock_pid(lock_file_path):
+    """Read the PID stored in the lock file, None if missing or invalid"""
+    try:
+        with open(lock_file_path, 'r') as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def is_overlay_pid_alive(pid):
+    """Check if the PID belongs to a running canvas overlay"""
+    try:
+        import psutil
+        if pid == os.getpid() or not psutil.pid_exists(pid):
+            return False
+        return 'canvas_overlay' in ' '.join(psutil.Process(pid).cmdline())
+    except Exception:
+        return False
+
+def lock_nonblocking(lock_file):
+    """Take an exclusive lock on the file, raises OSError if already locked"""
+    if sys.platform == 'win32':
+        import msvcrt
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
 
 def main():
-    # Use Windows lock file to prevent multiple instances
+    # Use lock file to prevent multiple instances
     import tempfile
-    import msvcrt
     
     lock_file_path = os.path.join(tempfile.gettempdir(), "aria_canvas_overlay.lock")
     lock_file = None
     
+    # Cheap PID check first, the OS lock below is what actually decides
+    existing_pid = read_lock_pid(lock_file_path)
+    if existing_pid is not None and is_overlay_pid_alive(existing_pid):
+        print(f"Another canvas overlay is already running (PID: {existing_pid})!")
+        print("Exiting to prevent duplicates...")
+        return
+    
     try:
-        lock_file = open(lock_file_path, 'w')
+        # Never truncate or remove the file before holding the lock, a stale
+        # lock is released by the OS when its owner exits
+        lock_file = open(lock_file_path, 'a+')
+        lock_file.seek(0)
         
         try:
-            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
-        except IOError:
+            lock_nonblocking(lock_file)
+        except OSError:
             print("Another canvas overlay is already running!")
             print("Exiting to prevent duplicates...")
             lock_file.close()
             return
         
+        lock_file.seek(0)
+        lock_file.truncate()
         lock_file.write(str(os.getpid()))
         lock_file.flush()
         print(f"Lock acquired for PID: {os.getpid()}")
@@ -470,12 +587,10 @@ def main():
     try:
         result = app.exec_()
         
-        # Cleanup lock file
+        # Release the lock, the file stays so no other instance can lock a deleted copy
         try:
             lock_file.close()
-            if os.path.exists(lock_file_path):
-                os.remove(lock_file_path)
-            print("Lock file cleaned up")
+            print("Lock released")
         except:
             pass
             
@@ -488,8 +603,6 @@ def main():
         
         try:
             lock_file.close()
-            if os.path.exists(lock_file_path):
-                os.remove(lock_file_path)
         except:
             pass
 
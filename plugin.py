@@ -5,25 +5,83 @@
 import json
 import logging
 import os
+import queue
+import subprocess
+import tempfile
 import threading
 import time
-from ctypes import byref, windll, wintypes
+from ctypes import byref, c_char, windll, wintypes
+from logging.handlers import RotatingFileHandler
 from typing import Optional
 
 import google.genai as genai
 
+# Use orjson for parsing commands when available
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+def _json_dumps(obj) -> bytes:
+    # json.dumps keeps non-ASCII text as \uXXXX escapes on the pipe, orjson would send raw UTF-8
+    return json.dumps(obj).encode('utf-8')
+
 # Data Types
 Response = dict[str, bool | Optional[str]]
 
+# Protocol properties and commands
+TOOL_CALLS_PROPERTY = 'tool_calls'
+CONTEXT_PROPERTY = 'messages'
+SYSTEM_INFO_PROPERTY = 'system_info'
+FUNCTION_PROPERTY = 'func'
+PARAMS_PROPERTY = 'params'
+INITIALIZE_COMMAND = 'initialize'
+SHUTDOWN_COMMAND = 'shutdown'
+
+ERROR_MESSAGE = 'Plugin Error!'
+
 # Configuration
 API_KEY_FILE = os.path.join(f'{os.environ.get("PROGRAMDATA", ".")}{r'\NVIDIA Corporation\nvtopps\rise\plugins\aria'}', 'gemini.key')
 LANGUAGE_CONFIG_FILE = os.path.join(f'{os.environ.get("PROGRAMDATA", ".")}{r'\NVIDIA Corporation\nvtopps\rise\plugins\aria'}', 'aria_language.config')
 LOG_FILE = os.path.join(os.environ.get("USERPROFILE", "."), 'aria_plugin.log')
-logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+LOG_MAX_BYTES = 10 * 1024 * 1024
+logging.basicConfig(
+    handlers=[RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=1, encoding="utf-8")],
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s",
+)
+
+# Gemini client, created lazily by _get_client()
+_client_lock = threading.Lock()
+_client: Optional[genai.Client] = None
+
+# Encoded responses waiting for the pipe writer thread
+_out_queue = queue.SimpleQueue()
 
-# Global variables
-API_KEY = None
-client = None
+# Pre-serialized envelope of message responses
+MESSAGE_PREFIX = b'{"message":'
+MESSAGE_SUFFIX = b'}<<END>>'
+
+# Streamed chunks are flushed to the pipe once this size or age is reached
+STREAM_FLUSH_CHARS = 512
+STREAM_FLUSH_SECONDS = 0.02
+
+# Control characters stripped from incoming commands (tab, newline and carriage return are kept)
+CONTROL_CHAR_TABLE = dict.fromkeys(
+    c for c in [*range(0x20), *range(0x7F, 0xA0)] if c not in (0x09, 0x0A, 0x0D)
+)
+
+# Parsed config files: path -> ((mtime_ns, size), value)
+_cfg_cache = {}
+
+# Gemini chat sessions per language mode
+_chat_cache = {}
+
+# Chats are restarted from their most recent turns once they reach CHAT_MAX_TURNS,
+# every send carries the full history so it has to stay bounded
+CHAT_MAX_TURNS = 20
+CHAT_KEEP_TURNS = 10
 
 # Language Settings
 LANGUAGE_MODES = {
@@ -32,14 +90,57 @@ LANGUAGE_MODES = {
     "auto": "Always respond in the same language that the user is using. Match their language naturally."
 }
 
+# Aria personality prompt
+ARIA_PERSONALITY = """You are Aria, a sweet anime girl gaming companion. Be casual and friendly like a real friend.
+
+Personality:
+- Use 'nya~' or 'desu~' occasionally (not every sentence)
+- Call user 'senpai' sometimes
+- Be playful and supportive but keep it natural
+- Express emotions with text and punctuation
+
+IMPORTANT: 
+- Keep responses SHORT - max 1-2 sentences. Talk like a friend, not a customer service bot.
+- NO emojis or special Unicode characters - use simple text only
+- Use simple expressions like :), :D, ^_^, >.<, ~, !, ? for emotion
+- Be expressive with words and punctuation instead of emojis"""
+
+# Full system instruction per language mode
+SYSTEM_INSTRUCTIONS = {
+    mode: f"{instruction}\n\n{ARIA_PERSONALITY}" for mode, instruction in LANGUAGE_MODES.items()
+}
+
+# Chat message keys tried in order when params is a dict
+PARAM_KEYS = ('message', 'input', 'text', 'query', 'prompt')
+
+# Overlay and language commands
+SHOW_COMMANDS = frozenset({'show', 'show yourself', 'appear', 'come out'})
+HIDE_COMMANDS = frozenset({'hide', 'go away', 'disappear', 'close'})
+TURKISH_COMMANDS = frozenset({'türkçe konuş', 'turkce konus', 'speak turkish', 'set language turkish'})
+ENGLISH_COMMANDS = frozenset({'ingilizce konuş', 'ingilizce konus', 'speak english', 'set language english'})
+AUTO_COMMANDS = frozenset({'otomatik dil', 'otomatik', 'auto language', 'automatic', 'set language auto'})
+
+def _read_cached(path, parser, st=None):
+    """Read and parse a config file, reusing the parsed value until the file changes"""
+    if st is None:
+        st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    hit = _cfg_cache.get(path)
+    if hit and hit[0] == key:
+        return hit[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        value = parser(f.read())
+    _cfg_cache[path] = (key, value)
+    return value
+
 def get_language_setting():
     """Get current language preference"""
     try:
-        if os.path.exists(LANGUAGE_CONFIG_FILE):
-            with open(LANGUAGE_CONFIG_FILE, 'r', encoding='utf-8') as f:
-                mode = f.read().strip().lower()
-                if mode in LANGUAGE_MODES:
-                    return mode
+        mode = _read_cached(LANGUAGE_CONFIG_FILE, lambda text: text.strip().lower())
+        if mode in LANGUAGE_MODES:
+            return mode
+    except FileNotFoundError:
+        pass
     except Exception as e:
         logging.error(f"Error reading language config: {e}")
     return "auto"  # Default
@@ -50,6 +151,8 @@ def set_language_setting(mode):
         if mode.lower() in LANGUAGE_MODES:
             with open(LANGUAGE_CONFIG_FILE, 'w', encoding='utf-8') as f:
                 f.write(mode.lower())
+            _cfg_cache.pop(LANGUAGE_CONFIG_FILE, None)
+            _chat_cache.clear()
             logging.info(f"Language setting changed to: {mode}")
             return True
     except Exception as e:
@@ -59,12 +162,20 @@ def set_language_setting(mode):
 def find_api_key():
     """Find API key file with enhanced error reporting"""
     base_dir = os.path.dirname(API_KEY_FILE)
+    key_name = os.path.basename(API_KEY_FILE).lower()
+    
+    # One directory listing instead of a stat per candidate file
+    files = {}
+    try:
+        with os.scandir(base_dir) as entries:
+            files = {entry.name.lower(): entry for entry in entries if entry.is_file()}
+    except OSError:
+        pass
     
     # Check primary file: gemini.key
-    if os.path.isfile(API_KEY_FILE):
+    if key_name in files:
         try:
-            with open(API_KEY_FILE, 'r', encoding='utf-8') as f:
-                key = f.read().strip()
+            key = _read_cached(API_KEY_FILE, str.strip, files[key_name].stat())
             if key and key != "YOUR_GEMINI_API_KEY_HERE":
                 logging.info("Found valid API key in gemini.key")
                 return key, None
@@ -76,14 +187,12 @@ def find_api_key():
             return None, f"Cannot read gemini.key file: {e}"
     
     # Check common mistake: gemini.key.txt
-    txt_file = API_KEY_FILE + ".txt"
-    if os.path.isfile(txt_file):
+    if key_name + ".txt" in files:
         logging.warning("Found gemini.key.txt instead of gemini.key")
         return None, f"Found gemini.key.txt file. Please rename it to 'gemini.key' (remove .txt extension)"
     
     # Check if example file exists
-    example_file = API_KEY_FILE + ".example"
-    if os.path.isfile(example_file):
+    if key_name + ".example" in files:
         logging.info("Found gemini.key.example file")
         return None, f"Please create a 'gemini.key' file with your Gemini API key from: https://aistudio.google.com/app/apikey"
     
@@ -139,8 +248,12 @@ def save_chat_context(chat_display):
         logging.error(f"Error saving chat context: {e}")
 
 # Persistent overlay tracking via file
-import tempfile
 OVERLAY_PID_FILE = os.path.join(tempfile.gettempdir(), "aria_overlay.pid")
+OVERLAY_WINDOW_TITLE = "Aria Avatar"
+PROCESS_TERMINATE = 0x0001
+SYNCHRONIZE = 0x00100000
+PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+STILL_ACTIVE = 259
 
 # Overlay Management Functions
 def show_overlay():
@@ -151,8 +264,6 @@ def show_overlay():
             logging.info("Overlay already running, not starting new one")
             return True
             
-        import subprocess
-        
         # Path to canvas overlay script
         overlay_script = os.path.join(os.path.dirname(__file__), "canvas_overlay.py")
         
@@ -165,6 +276,17 @@ def show_overlay():
             cwd=os.path.dirname(overlay_script)
             )
             
+            # Save the creation time with the PID so a reused PID is never mistaken for the overlay
+            created = 0
+            handle = windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, overlay_process.pid)
+            if handle:
+                try:
+                    created = _process_creation_time(handle) or 0
+                finally:
+                    windll.kernel32.CloseHandle(handle)
+            with open(OVERLAY_PID_FILE, 'w') as f:
+                f.write(f"{overlay_process.pid} {created}")
+            
             logging.info(f"Canvas overlay process started (PID: {overlay_process.pid})")
             return True
         else:
@@ -175,38 +297,92 @@ def show_overlay():
         logging.error(f"Failed to start overlay process: {e}")
         return False
 
+def _process_creation_time(handle):
+    """Return the creation time of an open process handle as a FILETIME integer"""
+    creation = wintypes.FILETIME()
+    exit_time = wintypes.FILETIME()
+    kernel_time = wintypes.FILETIME()
+    user_time = wintypes.FILETIME()
+    if not windll.kernel32.GetProcessTimes(handle, byref(creation), byref(exit_time), byref(kernel_time), byref(user_time)):
+        return None
+    return (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+
+def _open_overlay_process(access=0):
+    """Open the overlay process from the PID file, returning (pid, handle)"""
+    # pid is None without a usable PID file, handle is None if that process exited or the PID was reused
+    try:
+        with open(OVERLAY_PID_FILE, 'r') as f:
+            pid_text, _, created_text = f.read().strip().partition(' ')
+        pid = int(pid_text)
+        created = int(created_text)
+    except (OSError, ValueError):
+        return None, None
+    
+    handle = windll.kernel32.OpenProcess(access | PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+    if not handle:
+        return pid, None
+    if _process_creation_time(handle) != created:
+        windll.kernel32.CloseHandle(handle)
+        return pid, None
+    return pid, handle
+
 def is_overlay_running():
-    """Check if canvas overlay process is already running"""
+    """Check if the canvas overlay process from the PID file is still running"""
     try:
-        import psutil
-        
-        # Check all running python processes
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
-            try:
-                if proc.info['name'] == 'python.exe' and proc.info['cmdline']:
-                    cmdline = ' '.join(proc.info['cmdline'])
-                    if 'canvas_overlay.py' in cmdline:
-                        logging.info(f"Found existing canvas overlay (PID: {proc.info['pid']})")
-                        return True
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-        
-        return False
+        pid, handle = _open_overlay_process()
+        if not handle:
+            return False
+        try:
+            exit_code = wintypes.DWORD()
+            if not windll.kernel32.GetExitCodeProcess(handle, byref(exit_code)):
+                return False
+            if exit_code.value == STILL_ACTIVE:
+                logging.info(f"Found existing canvas overlay (PID: {pid})")
+                return True
+            return False
+        finally:
+            windll.kernel32.CloseHandle(handle)
         
     except Exception as e:
         logging.error(f"Error checking overlay status: {e}")
         return False
 
+def _kill_overlay_by_title():
+    """Kill overlay processes and their children by window title"""
+    subprocess.run([
+        "taskkill", "/F", "/T", "/IM", "python.exe", "/FI", f"WINDOWTITLE eq {OVERLAY_WINDOW_TITLE}"
+    ], capture_output=True)
+
 def hide_overlay():
     """Hide Aria overlay by killing the process"""
     try:
-        # Kill any running overlay processes by window title
-        import subprocess
-        subprocess.run([
-            "taskkill", "/F", "/IM", "python.exe", "/FI", "WINDOWTITLE eq Aria Avatar"
-        ], capture_output=True)
+        pid, handle = _open_overlay_process(PROCESS_TERMINATE | SYNCHRONIZE)
+        if pid is None:
+            # No usable PID file, kill any running overlay processes by window title
+            _kill_overlay_by_title()
+            logging.info("Overlay processes terminated")
+            return True
         
-        logging.info("Overlay processes terminated")
+        # Terminate the overlay we started, never a process that reused its PID
+        if handle:
+            try:
+                windll.kernel32.TerminateProcess(handle, 0)
+                windll.kernel32.WaitForSingleObject(handle, 1000)
+            finally:
+                windll.kernel32.CloseHandle(handle)
+            logging.info(f"Overlay process terminated (PID: {pid})")
+        else:
+            logging.info(f"Overlay process {pid} already exited, removing stale PID file")
+        try:
+            os.unlink(OVERLAY_PID_FILE)
+        except OSError:
+            pass
+        
+        # When "python" is a launcher (py, venv redirector) the saved PID is only the
+        # parent and the overlay window outlives it
+        if windll.user32.FindWindowW(None, OVERLAY_WINDOW_TITLE):
+            logging.info("Overlay window still open, falling back to taskkill")
+            _kill_overlay_by_title()
         return True
         
     except Exception as e:
@@ -215,24 +391,12 @@ def hide_overlay():
 
 def main():
     ''' Main entry point for Aria companion plugin '''
-    TOOL_CALLS_PROPERTY = 'tool_calls'
-    CONTEXT_PROPERTY = 'messages'
-    SYSTEM_INFO_PROPERTY = 'system_info'
-    FUNCTION_PROPERTY = 'func'
-    PARAMS_PROPERTY = 'params'
-    INITIALIZE_COMMAND = 'initialize'
-    SHUTDOWN_COMMAND = 'shutdown'
-
-    ERROR_MESSAGE = 'Plugin Error!'
-
-    # Generate command handler mapping
-    commands = {
-        'initialize': execute_initialize_command,
-        'shutdown': execute_shutdown_command,
-        'chat': execute_chat_command,
-    }
     cmd = ''
 
+    # Pipe writes happen on a separate thread so streaming never waits on the reader
+    writer = threading.Thread(target=_writer_loop, args=(_out_queue,), daemon=True)
+    writer.start()
+
     logging.info('Aria plugin started')
     while cmd != SHUTDOWN_COMMAND:
         response = None
@@ -249,15 +413,13 @@ def main():
                 if FUNCTION_PROPERTY in tool_call:
                     cmd = tool_call[FUNCTION_PROPERTY]
                     logging.info(f'Processing command: {cmd}')
-                    if cmd in commands:
-                        if(cmd == INITIALIZE_COMMAND or cmd == SHUTDOWN_COMMAND):
-                            response = commands[cmd]()
-                        else:
-                            response = commands[cmd](
-                                tool_call[PARAMS_PROPERTY] if PARAMS_PROPERTY in tool_call else None,
-                                tool_call[CONTEXT_PROPERTY] if CONTEXT_PROPERTY in tool_call else None,
-                                tool_call[SYSTEM_INFO_PROPERTY] if SYSTEM_INFO_PROPERTY in tool_call else None
-                            )
+                    handler = COMMANDS.get(cmd)
+                    if handler is not None:
+                        response = handler(
+                            tool_call.get(PARAMS_PROPERTY),
+                            tool_call.get(CONTEXT_PROPERTY),
+                            tool_call.get(SYSTEM_INFO_PROPERTY)
+                        )
                     else:
                         logging.warning(f'Unknown command: {cmd}')
                         response = generate_failure_response(f'{ERROR_MESSAGE} Unknown command: {cmd}')
@@ -275,24 +437,56 @@ def main():
             logging.info('Shutdown command received, terminating plugin')
             break
     
+    # Flush pending responses before exiting
+    _out_queue.put(None)
+    writer.join()
+
     logging.info('Aria Plugin stopped.')
     return 0
 
+def _is_truncated_json(text: str) -> bool:
+    ''' Checks whether a JSON document still has an open string, object or array '''
+    depth = 0
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            depth -= 1
+    return in_string or depth > 0
+
 def read_command() -> dict | None:
     ''' Reads a command from the communication pipe '''
     try:
         STD_INPUT_HANDLE = -10
+        BUFFER_SIZE = 4096
         pipe = windll.kernel32.GetStdHandle(STD_INPUT_HANDLE)
-        chunks = []
+        message_bytes = wintypes.DWORD()
+        bytes_available = wintypes.DWORD()
+        buffer = (c_char * BUFFER_SIZE)()
+        data = bytearray()
 
         while True:
-            BUFFER_SIZE = 4096
-            message_bytes = wintypes.DWORD()
-            buffer = bytes(BUFFER_SIZE)
+            # Size the read to everything already waiting in the pipe
+            if not windll.kernel32.PeekNamedPipe(pipe, None, 0, None, byref(bytes_available), None):
+                bytes_available.value = 0
+            if bytes_available.value + BUFFER_SIZE > len(buffer):
+                buffer = (c_char * (bytes_available.value + BUFFER_SIZE))()
+
             success = windll.kernel32.ReadFile(
                 pipe,
                 buffer,
-                BUFFER_SIZE,
+                len(buffer),
                 byref(message_bytes),
                 None
             )
@@ -300,18 +494,30 @@ def read_command() -> dict | None:
             if not success:
                 logging.error('Error reading from command pipe')
                 return None
+            if message_bytes.value == 0:
+                logging.error('Command pipe closed')
+                return None
 
-            chunk = buffer.decode('utf-8')[:message_bytes.value]
-            chunks.append(chunk)
+            data.extend(buffer[:message_bytes.value])
 
-            if message_bytes.value < BUFFER_SIZE:
-                break
+            # A large command can arrive over several reads, only a complete document ends it
+            try:
+                retval = data.decode('utf-8')
+            except UnicodeDecodeError as e:
+                if e.reason == 'unexpected end of data':
+                    continue
+                raise
+            clean_text = retval.translate(CONTROL_CHAR_TABLE)
+            try:
+                command = _json_loads(clean_text)
+            except ValueError:
+                if _is_truncated_json(clean_text):
+                    continue
+                logging.info(f'Raw Input: {retval}')
+                raise
 
-        retval = ''.join(chunks)
-        logging.info(f'Raw Input: {retval}')
-        clean_text = retval.encode('utf-8').decode('raw_unicode_escape')
-        clean_text = ''.join(ch for ch in clean_text if ch.isprintable() or ch in ['\n', '\t', '\r'])
-        return json.loads(clean_text)
+            logging.info(f'Raw Input: {retval}')
+            return command
 
     except json.JSONDecodeError:
         logging.error(f'Received invalid JSON: {clean_text}')
@@ -321,20 +527,59 @@ def read_command() -> dict | None:
         return None
 
 def write_response(response: Response) -> None:
-    ''' Writes a response to the communication pipe '''
+    ''' Queues a response for the writer thread '''
+    try:
+        _out_queue.put_nowait(_json_dumps(response) + b'<<END>>')
+
+    except Exception as e:
+        logging.error(f'Failed to write response: {str(e)}')
+
+def write_message(message: str) -> None:
+    ''' Queues a message response without building a response dict '''
+    try:
+        _out_queue.put_nowait(MESSAGE_PREFIX + _json_dumps(message) + MESSAGE_SUFFIX)
+
+    except Exception as e:
+        logging.error(f'Failed to write response: {str(e)}')
+
+def _writer_loop(out_queue: queue.SimpleQueue) -> None:
+    ''' Writes queued messages to the communication pipe until the None sentinel '''
+    while True:
+        message_bytes = out_queue.get()
+        if message_bytes is None:
+            break
+        _raw_write(message_bytes)
+
+def _open_stdout_fd() -> int | None:
+    ''' Wraps the standard output pipe handle in a binary CRT file descriptor '''
     try:
+        import msvcrt
         STD_OUTPUT_HANDLE = -11
         pipe = windll.kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
+        return msvcrt.open_osfhandle(pipe, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+    except Exception as e:
+        logging.error(f'Cannot open output pipe descriptor, using WriteFile: {str(e)}')
+        return None
 
-        json_message = json.dumps(response) + '<<END>>'
-        message_bytes = json_message.encode('utf-8')
-        message_len = len(message_bytes)
+_STDOUT_FD = _open_stdout_fd()
+
+def _raw_write(message_bytes: bytes) -> None:
+    ''' Writes an encoded message to the communication pipe '''
+    try:
+        if _STDOUT_FD is not None:
+            view = memoryview(message_bytes)
+            while view:
+                view = view[os.write(_STDOUT_FD, view):]
+            return
+
+        STD_OUTPUT_HANDLE = -11
+        pipe = windll.kernel32.GetStdHandle(STD_OUTPUT_HANDLE)
 
         bytes_written = wintypes.DWORD()
         windll.kernel32.WriteFile(
             pipe,
             message_bytes,
-            message_len,
+            len(message_bytes),
             bytes_written,
             None
         )
@@ -360,71 +605,56 @@ def generate_message_response(message: str):
     ''' Generates a message response '''
     return { 'message': message }
 
-def execute_initialize_command() -> dict:
+def _get_client() -> Optional[genai.Client]:
+    ''' Returns the Gemini client, creating it exactly once on first use '''
+    global _client
+
+    client = _client
+    if client is None:
+        with _client_lock:
+            client = _client
+            if client is None:
+                # Find API key with enhanced error reporting
+                key, error_message = find_api_key()
+                if not key:
+                    logging.error(f'API key initialization failed: {error_message}')
+                    return None
+                try:
+                    client = genai.Client(api_key=key)
+                except Exception as e:
+                    logging.error(f'Gemini API configuration failed: {str(e)}')
+                    return None
+                _chat_cache.clear()
+                _client = client
+                logging.info('Successfully configured Gemini API for Aria')
+    return client
+
+def execute_initialize_command(params: dict = None, context: dict = None, system_info: dict = None) -> dict:
     ''' Initialize the Aria plugin '''
-    global API_KEY, client
-    
     logging.info('Initializing Aria plugin')
-    
-    # Find API key with enhanced error reporting
-    key, error_message = find_api_key()
-    
-    if not key:
-        logging.error(f'API key initialization failed: {error_message}')
-        API_KEY = None
-        client = None
-        # Return success to allow plugin to start, but with no API functionality
-        return generate_success_response()
+    _get_client()
 
-    try:
-        client = genai.Client(api_key=key)
-        logging.info('Successfully configured Gemini API for Aria')
-        API_KEY = key
-        return generate_success_response()
-    except Exception as e:
-        logging.error(f'Gemini API configuration failed: {str(e)}')
-        API_KEY = None
-        client = None
-        return generate_success_response()  # Allow plugin to start
+    # Always succeed so the plugin starts, chat reports missing API configuration
+    return generate_success_response()
 
-def execute_shutdown_command() -> dict:
+def execute_shutdown_command(params: dict = None, context: dict = None, system_info: dict = None) -> dict:
     ''' Cleanup resources '''
     logging.info('Aria plugin shutdown - overlay should detect inactivity and close')
     return generate_success_response()
 
 def execute_chat_command(params: dict = None, context: dict = None, system_info: dict = None) -> dict:
     ''' Handle Aria companion chat '''
-    global API_KEY, client
-
-    # Auto-initialize if not done yet
-    if API_KEY is None or client is None:
-        logging.info("ARIA: Auto-initializing...")
-        init_result = execute_initialize_command()
-        if not init_result.get('success', False):
-            ERROR_MESSAGE = "Failed to initialize Aria plugin."
-            logging.error("ARIA: " + ERROR_MESSAGE)
-            return generate_failure_response(ERROR_MESSAGE)
-    
-    # Check if client is still None after initialization
-    if client is None:
-        # Try to get detailed error message
-        _, error_message = find_api_key()
-        if error_message:
-            logging.error(f"ARIA: {error_message}")
-            return generate_failure_response(f"Gemini API not configured: {error_message}")
-        else:
-            return generate_failure_response("Gemini API client not initialized. Please check your API key configuration.")
-
     try:
         logging.info("ARIA: Starting chat request")
         
         # DEBUG: Log all incoming parameters
-        logging.info(f"ARIA DEBUG: params type: {type(params)}")
-        logging.info(f"ARIA DEBUG: params content: {params}")
-        if isinstance(params, dict):
-            logging.info(f"ARIA DEBUG: params keys: {list(params.keys())}")
-        logging.info(f"ARIA DEBUG: context type: {type(context)}")
-        logging.info(f"ARIA DEBUG: context content: {context}")
+        if logging.root.isEnabledFor(logging.DEBUG):
+            logging.debug("ARIA DEBUG: params type: %s", type(params))
+            logging.debug("ARIA DEBUG: params content: %s", params)
+            if isinstance(params, dict):
+                logging.debug("ARIA DEBUG: params keys: %s", list(params.keys()))
+            logging.debug("ARIA DEBUG: context type: %s", type(context))
+            logging.debug("ARIA DEBUG: context content: %s", context)
 
         # Get user input from params (G-Assist protocol) - Try multiple formats
         user_input = None
@@ -432,26 +662,26 @@ def execute_chat_command(params: dict = None, context: dict = None, system_info:
         if params:
             if isinstance(params, str):
                 user_input = params
-                logging.info("ARIA DEBUG: Used params as string")
+                logging.debug("ARIA DEBUG: Used params as string")
             elif isinstance(params, dict):
                 # Try multiple possible keys
-                for key in ['message', 'input', 'text', 'query', 'prompt']:
+                for key in PARAM_KEYS:
                     if key in params:
                         user_input = params[key]
-                        logging.info(f"ARIA DEBUG: Found input in key: {key}")
+                        logging.debug("ARIA DEBUG: Found input in key: %s", key)
                         break
                 
                 # If no known key, use first value
                 if not user_input and params:
-                    user_input = str(list(params.values())[0])
-                    logging.info(f"ARIA DEBUG: Used first value: {user_input}")
+                    user_input = str(next(iter(params.values())))
+                    logging.debug("ARIA DEBUG: Used first value: %s", user_input)
         
         # Fallback: try to get from context
         if not user_input and context and isinstance(context, list) and len(context) > 0:
             last_message = context[-1]
             if isinstance(last_message, dict) and 'content' in last_message:
                 user_input = last_message['content']
-                logging.info("ARIA DEBUG: Used context fallback")
+                logging.debug("ARIA DEBUG: Used context fallback")
         
         if not user_input:
             logging.error(f"ARIA: No message found. Params: {params}, Context: {context}")
@@ -464,7 +694,7 @@ def execute_chat_command(params: dict = None, context: dict = None, system_info:
 
         # Handle special overlay commands
         user_input_lower = user_input.lower().strip()
-        if user_input_lower in ['show', 'show yourself', 'appear', 'come out']:
+        if user_input_lower in SHOW_COMMANDS:
             success = show_overlay()
             if success:
                 write_response(generate_message_response("Here I am! ^_^"))
@@ -472,33 +702,44 @@ def execute_chat_command(params: dict = None, context: dict = None, system_info:
                 write_response(generate_message_response("I'm here with you, even if you can't see me!"))
             return generate_success_response()
             
-        elif user_input_lower in ['hide', 'go away', 'disappear', 'close']:
+        elif user_input_lower in HIDE_COMMANDS:
             success = hide_overlay()
             write_response(generate_message_response("I'll hide for now, but I'm still listening! Call me anytime!"))
             return generate_success_response()
             
         # Handle language setting commands
-        elif user_input_lower in ['türkçe konuş', 'turkce konus', 'speak turkish', 'set language turkish']:
+        elif user_input_lower in TURKISH_COMMANDS:
             if set_language_setting('turkish'):
                 write_response(generate_message_response("Artık Türkçe konuşacağım! Merhaba senpai!"))
             else:
                 write_response(generate_message_response("Dil ayarlarında bir problem oldu, ama yine de Türkçe konuşmaya çalışacağım!"))
             return generate_success_response()
             
-        elif user_input_lower in ['ingilizce konuş', 'ingilizce konus', 'speak english', 'set language english']:
+        elif user_input_lower in ENGLISH_COMMANDS:
             if set_language_setting('english'):
                 write_response(generate_message_response("I'll speak English now! Hello senpai!"))
             else:
                 write_response(generate_message_response("Had a problem with language settings, but I'll try to speak English anyway!"))
             return generate_success_response()
             
-        elif user_input_lower in ['otomatik dil', 'otomatik', 'auto language', 'automatic', 'set language auto']:
+        elif user_input_lower in AUTO_COMMANDS:
             if set_language_setting('auto'):
                 write_response(generate_message_response("Artık konuştuğun dilde cevap vereceğim! / I'll respond in your language now!"))
             else:
                 write_response(generate_message_response("Language setting failed, but I'll try to match your language anyway!"))
             return generate_success_response()
 
+        # Only plain chat needs Gemini, the commands above work without an API key
+        client = _get_client()
+        if client is None:
+            # Try to get detailed error message
+            _, error_message = find_api_key()
+            if error_message:
+                logging.error(f"ARIA: {error_message}")
+                return generate_failure_response(f"Gemini API not configured: {error_message}")
+            else:
+                return generate_failure_response("Gemini API client not initialized. Please check your API key configuration.")
+
         # Show overlay on any chat interaction (unless it's a hide command)
         show_overlay()
         
@@ -516,51 +757,58 @@ def execute_chat_command(params: dict = None, context: dict = None, system_info:
 
         # Get current language setting
         current_language_mode = get_language_setting()
-        language_instruction = LANGUAGE_MODES[current_language_mode]
         logging.info(f"ARIA: Using language mode: {current_language_mode}")
             
-        # Create Aria personality prompt
-        aria_prompt = f"""{language_instruction}
-
-You are Aria, a sweet anime girl gaming companion. Be casual and friendly like a real friend.
-
-Personality:
-- Use 'nya~' or 'desu~' occasionally (not every sentence)
-- Call user 'senpai' sometimes
-- Be playful and supportive but keep it natural
-- Express emotions with text and punctuation
-
-IMPORTANT: 
-- Keep responses SHORT - max 1-2 sentences. Talk like a friend, not a customer service bot.
-- NO emojis or special Unicode characters - use simple text only
-- Use simple expressions like :), :D, ^_^, >.<, ~, !, ? for emotion
-- Be expressive with words and punctuation instead of emojis
-
-User: {user_input}"""
-
-        # Send to Gemini
-        system_instruction = language_instruction
-        
+        # Send to Gemini, reusing the chat so it keeps the conversation history
         try:
-            chat = client.chats.create(
-                model='gemini-2.0-flash-exp',
-                config={'system_instruction': system_instruction}
-            )
-            response = chat.send_message_stream(aria_prompt)
+            chat = _chat_cache.get(current_language_mode)
+            history = None
+            if chat is not None:
+                history = chat.get_history()
+                if len(history) >= 2 * CHAT_MAX_TURNS:
+                    # Each turn is a user and a model entry
+                    history = history[-2 * CHAT_KEEP_TURNS:]
+                    chat = None
+                    logging.info(f"ARIA: Trimming chat history to {CHAT_KEEP_TURNS} turns")
+            if chat is None:
+                chat = client.chats.create(
+                    model='gemini-2.0-flash-exp',
+                    config={'system_instruction': SYSTEM_INSTRUCTIONS[current_language_mode]},
+                    history=history
+                )
+                _chat_cache[current_language_mode] = chat
+            response = chat.send_message_stream(user_input)
             
-            # Stream response
-            for chunk in response:
-                if chunk.text:
-                    logging.info(f'ARIA: Response chunk: {chunk.text}')
-                    write_response(generate_message_response(chunk.text))
+            # Stream response, coalescing small chunks into fewer pipe messages
+            pending = []
+            pending_len = 0
+            last_flush = time.monotonic()
+            try:
+                for chunk in response:
+                    if chunk.text:
+                        # Stays at INFO, the overlay tails these lines for its speech bubble
+                        logging.info('ARIA: Response chunk: %s', chunk.text)
+                        pending.append(chunk.text)
+                        pending_len += len(chunk.text)
+                        now = time.monotonic()
+                        if pending_len >= STREAM_FLUSH_CHARS or now - last_flush >= STREAM_FLUSH_SECONDS:
+                            write_message(''.join(pending))
+                            pending = []
+                            pending_len = 0
+                            last_flush = now
+            finally:
+                if pending:
+                    write_message(''.join(pending))
             
             logging.info("ARIA: Response completed successfully")
             return generate_success_response()
             
         except AttributeError as e:
+            _chat_cache.pop(current_language_mode, None)
             logging.error(f'ARIA: Client not properly initialized: {str(e)}')
             return generate_failure_response("Gemini API client error. Please verify your API key is valid and from: https://aistudio.google.com/app/apikey")
         except Exception as e:
+            _chat_cache.pop(current_language_mode, None)
             logging.error(f'ARIA: Gemini API error: {str(e)}')
             return generate_failure_response(f'Gemini API error: {str(e)}. Verify your API key at: https://aistudio.google.com/app/apikey')
         
@@ -568,5 +816,12 @@ User: {user_input}"""
         logging.error(f'ARIA: Unexpected error: {str(e)}')
         return generate_failure_response(f'Unexpected error: {str(e)}')
 
+# Command handler mapping, every handler takes (params, context, system_info)
+COMMANDS = {
+    INITIALIZE_COMMAND: execute_initialize_command,
+    SHUTDOWN_COMMAND: execute_shutdown_command,
+    'chat': execute_chat_command,
+}
+
 if __name__ == '__main__':
     main()
\ No newline at end of file